@@ -3,19 +3,42 @@ ROOT = pathlib.Path(__file__).resolve().parent.parent  # project root
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
+import os
+import shutil
+import uuid
 import streamlit as st
+from streamlit_autorefresh import st_autorefresh
 from pathlib import Path
+from celery import Celery, states
 from celery.result import AsyncResult
+from app.uploads import removed_uploads
+from backend.compute import append_upload, prune_uploads
 from backend.tasks import factor_analysis
 import pandas as pd, altair as alt
 
 UPLOAD_DIR = Path("/shared/uploads")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://dragonfly:6379/0")
+RESULT_URL = os.getenv("CELERY_RESULT_BACKEND", BROKER_URL)
+
+# Finished-task payloads/charts are cached server-wide (shared by all
+# sessions); bound them so memory doesn't grow with every task run
+RESULT_CACHE_ENTRIES = 32
+RESULT_CACHE_TTL = "1h"
+
+POLL_INTERVAL_MS = 2000
+POLL_MAX_INTERVAL_MS = 15000
 
 st.set_page_config(page_title="StratLab", layout="wide")
 st.sidebar.title("StratLab ⛵")
 
 page = st.sidebar.radio("Navigate", ["Upload", "Factor Model", "Results"])
+if page != "Upload":
+    # The uploader isn't rendered here, so Streamlit drops its state; the next
+    # Upload visit starts without a "previous rerun" to diff against
+    st.session_state["uploader_ids"] = None
 
 
 def _render_task_failure(res: AsyncResult, err: Exception) -> None:
@@ -27,13 +50,50 @@ def _render_task_failure(res: AsyncResult, err: Exception) -> None:
         st.code(tb, language="text")
 
 
-def _render_results(out: dict) -> None:
-    """Render task output defensively (keys may be missing on partial failures)."""
-    if not isinstance(out, dict):
-        st.error("Unexpected task output format.")
-        return
+@st.cache_resource
+def celery_client() -> Celery:
+    """
+    Client-side Celery app shared by every rerun and session, so result
+    lookups reuse its pooled backend connections instead of reconnecting.
+    """
+    client = Celery("stratlab", broker=BROKER_URL, backend=RESULT_URL)
+    client.conf.update(
+        accept_content=["msgpack", "json"],
+        result_serializer="msgpack",
+        broker_pool_limit=10,
+    )
+    return client
+
+
+@st.cache_data(show_spinner=False, max_entries=RESULT_CACHE_ENTRIES, ttl=RESULT_CACHE_TTL)
+def fetch_result(task_id: str):
+    """Stored output of a finished task, cached so tab switches don't re-pull it from the backend."""
+    return AsyncResult(task_id, app=celery_client()).result
+
+
+@st.cache_data(show_spinner=False, max_entries=RESULT_CACHE_ENTRIES, ttl=RESULT_CACHE_TTL)
+def build_var_chart(task_id: str, x: tuple, y: tuple) -> alt.Chart:
+    """VaR bar chart, built once per task instead of on every rerun."""
+    return (
+        alt.Chart(pd.DataFrame({"x": x, "y": y}))
+        .mark_bar()
+        .encode(x="x:N", y="y:Q")
+        .properties(title="99% VaR by Symbol")
+    )
+
+
+@st.cache_data(show_spinner=False, max_entries=RESULT_CACHE_ENTRIES, ttl=RESULT_CACHE_TTL)
+def build_beta_chart(task_id: str, x: tuple, y: tuple) -> alt.Chart:
+    """Beta line chart, built once per task instead of on every rerun."""
+    return (
+        alt.Chart(pd.DataFrame({"x": x, "y": y}))
+        .mark_line(point=True)
+        .encode(x="x:N", y="y:Q")
+        .properties(title="CAMP Beta vs SPY")
+    )
+
 
-def _render_results(out: dict) -> None:
+def _render_results(out: dict, task_id: str) -> None:
     """Render task output defensively (keys may be missing on partial failures)."""
     if not isinstance(out, dict):
         st.error("Unexpected task output format.")
@@ -43,7 +103,7 @@ def _render_results(out: dict) -> None:
     summary_info = out.get("summary", {})
     if summary_info and "data" in summary_info:
         try:
-            # The data is already in list of dicts format, convert to DataFrame directly
+            # The data is column-oriented (name -> values), convert to DataFrame directly
             df = pd.DataFrame(summary_info["data"])
             st.subheader("Summary")
             st.dataframe(df, use_container_width=True)
@@ -62,14 +122,8 @@ def _render_results(out: dict) -> None:
     var_chart = out.get("var_chart")
     if isinstance(var_chart, dict) and var_chart.get("x") and var_chart.get("y"):
         try:
-            chart_data = pd.DataFrame(var_chart)
-            st.altair_chart(
-                alt.Chart(chart_data)
-                .mark_bar()
-                .encode(x="x:N", y="y:Q")
-                .properties(title="99% VaR by Symbol"),
-                use_container_width=True,
-            )
+            chart = build_var_chart(task_id, tuple(var_chart["x"]), tuple(var_chart["y"]))
+            st.altair_chart(chart, use_container_width=True)
         except Exception as e:
             st.warning(f"Could not render VaR chart: {e}")
 
@@ -77,14 +131,8 @@ def _render_results(out: dict) -> None:
     beta_chart = out.get("beta_chart")
     if isinstance(beta_chart, dict) and beta_chart.get("x") and beta_chart.get("y"):
         try:
-            chart_data = pd.DataFrame(beta_chart)
-            st.altair_chart(
-                alt.Chart(chart_data)
-                .mark_line(point=True)
-                .encode(x="x:N", y="y:Q")
-                .properties(title="CAMP Beta vs SPY"),
-                use_container_width=True,
-            )
+            chart = build_beta_chart(task_id, tuple(beta_chart["x"]), tuple(beta_chart["y"]))
+            st.altair_chart(chart, use_container_width=True)
         except Exception as e:
             st.warning(f"Could not render Beta chart: {e}")
 
@@ -92,35 +140,67 @@ def _render_results(out: dict) -> None:
         st.info("Task completed but no renderable outputs were returned.")
 
 
-def safe_get_result(res: AsyncResult, timeout: int = 10):
-    """Safely get result from Celery task, handling conversion errors."""
-    try:
-        return res.get(timeout=timeout, propagate=True)
-    except Exception as e:
-        error_msg = str(e)
-        # Check if it's the specific float conversion error we're dealing with
-        if "could not convert string to float" in error_msg and "2025-01-01" in error_msg:
-            st.error("Data processing error: Found date strings where numeric values were expected.")
-            st.info("This usually means your data has dates in the wrong columns. Please check that:")
-            st.markdown("""
-            - Date column contains only dates
-            - Price (Px) column contains only numbers  
-            - Return (Ret) column contains only numbers
-            - No date strings are mixed in with numeric data
-            """)
-            return None
-        else:
-            # Re-raise other exceptions
-            raise e
+if page == "Upload":
+    # All files of this session are coalesced into one Parquet dataset.
+    # Everything lives under a per-session directory so concurrent users
+    # never share a path.
+    if "session_id" not in st.session_state:
+        st.session_state["session_id"] = uuid.uuid4().hex
+    session_dir = UPLOAD_DIR / f"session-{st.session_state['session_id']}"
+    raw_dir = session_dir / "raw"
+    dataset_dir = session_dir / "dataset"
+    saved = st.session_state.setdefault("saved_uploads", {})  # file_id -> name
 
+    if saved:
+        st.caption("Session dataset: " + ", ".join(sorted(saved.values())))
+        if st.button("🗑️ Clear session dataset"):
+            shutil.rmtree(session_dir, ignore_errors=True)
+            saved.clear()
+            # A fresh uploader key empties the widget, so nothing is re-ingested
+            st.session_state["uploader_key"] = st.session_state.get("uploader_key", 0) + 1
+            st.session_state["uploader_ids"] = None
 
-if page == "Upload":
-    uploaded = st.file_uploader("Upload price data", type=["csv", "parquet"])
-    if uploaded:
-        dest = UPLOAD_DIR / uploaded.name
-        dest.write_bytes(uploaded.getbuffer())
-        st.session_state["data_path"] = str(dest)
-        st.success(f"Saved to {dest}")
+    uploads = st.file_uploader(
+        "Upload price data", type=["csv", "parquet"], accept_multiple_files=True,
+        key=f"uploader-{st.session_state.get('uploader_key', 0)}",
+    )
+
+    for uploaded in uploads or []:
+        # file_id is new for every upload, even of a same-named or same-sized file
+        if uploaded.file_id in saved:
+            continue  # already in the dataset
+        raw_dir.mkdir(parents=True, exist_ok=True)
+        dest = raw_dir / f"{uploaded.file_id}{Path(uploaded.name).suffix.lower()}"
+        # Stream to disk in fixed-size chunks instead of buffering the whole file
+        uploaded.seek(0)
+        with open(dest, "wb") as f:
+            while chunk := uploaded.read(UPLOAD_CHUNK_SIZE):
+                f.write(chunk)
+        try:
+            append_upload(dest, dataset_dir, upload_id=uploaded.file_id)
+        except Exception as e:
+            dest.unlink(missing_ok=True)
+            st.error(f"Could not add {uploaded.name} to the session dataset: {e}")
+            continue
+        saved[uploaded.file_id] = uploaded.name
+        st.success(f"Saved {uploaded.name} to {dest}")
+
+    # Only files the user removed during this visit drop out of the dataset;
+    # an uploader that came back empty after visiting another page keeps it
+    current = [u.file_id for u in uploads or []]
+    removed = removed_uploads(st.session_state.get("uploader_ids"), current, saved)
+    for file_id in removed:
+        del saved[file_id]
+        for raw in raw_dir.glob(f"{file_id}.*"):
+            raw.unlink()
+    if removed:
+        prune_uploads(dataset_dir, list(saved))
+    st.session_state["uploader_ids"] = current
+
+    if saved:
+        st.session_state["data_path"] = str(dataset_dir)
+    else:
+        st.session_state.pop("data_path", None)
 
 elif page == "Factor Model":
     if "data_path" not in st.session_state:
@@ -136,12 +216,11 @@ elif page == "Factor Model":
                 if result["success"]:
                     st.success("✅ Data loaded successfully!")
                     st.write("**Data Info:**")
-                    st.write(f"Shape: {result['shape']}")
+                    rows = result.get("rows")
+                    st.write(f"Rows: {rows if rows is not None else 'n/a (CSV schema probe)'}")
                     st.write(f"Columns: {result['columns']}")
                     st.write("**Data Types:**")
                     st.json(result['dtypes'])
-                    st.write("**Date Range:**")
-                    st.write(f"From {result['date_range']['min']} to {result['date_range']['max']}")
                 else:
                     st.error("❌ Data loading failed!")
                     st.code(result['error'])
@@ -163,6 +242,7 @@ elif page == "Factor Model":
                 # Dispatch Celery task with clear args
                 task = factor_analysis.delay(st.session_state["data_path"], priors)
                 st.session_state["task_id"] = task.id
+                st.session_state["poll_count"] = 0
                 st.info("Task dispatched – check Results tab.")
                 
             except Exception as e:
@@ -174,26 +254,26 @@ elif page == "Results":
     if not tid:
         st.info("No analysis run yet.")
     else:
-        res = AsyncResult(tid)
-        st.caption(f"Task status: {res.status}")
+        res = AsyncResult(tid, app=celery_client())
+        # One backend lookup per rerun; never block on res.get() here
+        state = res.state
+        st.caption(f"Task status: {state}")
 
-        if res.failed():
-            # Safely handle failed tasks
-            try:
-                safe_get_result(res, timeout=1)
-            except Exception as e:
-                _render_task_failure(res, e)
+        if state == states.FAILURE:
+            # For a failed task the stored result is the raised exception
+            _render_task_failure(res, res.result)
 
-        elif res.successful():
-            # FIXED: Use safe_get_result instead of direct res.get()
-            try:
-                out = safe_get_result(res, timeout=10)
-                if out is not None:
-                    _render_results(out)
-            except Exception as e:
-                _render_task_failure(res, e)
+        elif state == states.SUCCESS:
+            # The task has finished, so the stored result is read without waiting
+            _render_results(fetch_result(tid), tid)
+
+        elif state in states.READY_STATES:
+            st.warning(f"Task ended with status {state}; no results to show.")
 
         else:
-            with st.spinner("Running…"):
-                # No busy-loop; on user interaction or tab revisit it will update.
-                pass
\ No newline at end of file
+            st.info("Running… this page refreshes automatically until the task finishes.")
+            # Poll every 2s, doubling every 5 polls up to 15s; once the task
+            # is ready this branch no longer renders and the timer stops
+            polls = st.session_state.get("poll_count", 0)
+            interval = min(POLL_INTERVAL_MS * 2 ** (polls // 5), POLL_MAX_INTERVAL_MS)
+            st.session_state["poll_count"] = st_autorefresh(interval=interval, key=f"poll-{tid}")
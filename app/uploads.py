@@ -0,0 +1,20 @@
+"""
+app/uploads.py
+
+Upload-page bookkeeping, kept free of Streamlit so it can be unit tested.
+"""
+
+
+def removed_uploads(previous: list[str] | None, current: list[str], saved: dict[str, str]) -> list[str]:
+    """
+    Ingested upload ids (keys of `saved`) that the user removed from the uploader.
+
+    `previous` is the uploader's file ids on the prior rerun of the current
+    Upload page visit, or None on the first rerun of a visit. Streamlit drops
+    the uploader's state while another page is shown, so it comes back empty
+    on return; that is not a removal. Only a file that was shown on the last
+    rerun and is gone now counts.
+    """
+    if previous is None:
+        return []
+    return [file_id for file_id in saved if file_id in previous and file_id not in current]
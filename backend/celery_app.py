@@ -5,7 +5,7 @@ from celery import Celery
 # ------------------------------------------------------------------
 # Broker & result backend – tweak the URLs if you already use RabbitMQ
 # ------------------------------------------------------------------
-BROKER_URL  = os.getenv("CELERY_BROKER_URL",  "redis://redis:6379/0")
+BROKER_URL  = os.getenv("CELERY_BROKER_URL",  "redis://dragonfly:6379/0")
 RESULT_URL  = os.getenv("CELERY_RESULT_BACKEND", BROKER_URL)
 
 celery_app = Celery(
@@ -15,9 +15,10 @@ celery_app = Celery(
 )
 
 celery_app.conf.update(
-    task_serializer   = "json",
-    result_serializer = "json",
-    accept_content    = ["json"],
+    # msgpack: compact binary floats instead of JSON text; JSON still accepted
+    task_serializer   = "msgpack",
+    result_serializer = "msgpack",
+    accept_content    = ["msgpack", "json"],
     task_track_started = True,
     result_extended    = True,
 )
@@ -2,104 +2,296 @@
 backend/compute.py
 
 Defensive analytics engine for StratLab.
-Uses parse_to_float to coerce any value into float where possible,
-filtering out date strings or other garbage before calculations.
+All type coercion happens once at ingest (_read_and_clean): Px is float64,
+Date is datetime64 and Ret is float64, so the analytics below can work on
+raw NumPy buffers without per-value checks.
 """
 
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
+import hashlib
 import json
+import os
 import numpy as np
 import pandas as pd
-from sklearn.linear_model import LinearRegression
+from numba import njit, prange
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.dataset as pads
+from scipy.stats import norm
 
+# Cleaned CSV uploads are re-used as Parquet from here (shared with the worker)
+CACHE_DIR = Path(os.getenv("STRATLAB_CACHE_DIR", "/shared/cache"))
 
-def parse_to_float(value) -> float | None:
+# Part of the Parquet cache key; bump whenever _clean's output changes so
+# files cleaned by older code are not served
+_CLEAN_VERSION = 3
+
+# Expected CSV layout; enforced at parse time so pyarrow skips type inference
+CSV_COLUMN_TYPES = {"Date": pa.timestamp("ns"), "Symbol": pa.string(), "Px": pa.float64()}
+
+# Session datasets: every upload is appended as Parquet under Symbol=<sym>/
+DATASET_PARTITIONING = pads.partitioning(pa.schema([("Symbol", pa.string())]), flavor="hive")
+
+
+def _read_csv(p: Path) -> pd.DataFrame:
     """
-    Attempt to convert `value` to float.
-    - If already numeric, returns float(value).
-    - If string, first tries float(); if that fails, returns None.
-    - Specifically handles date strings like '2025-01-01'
+    Parse a price CSV with pyarrow's multi-threaded reader and a fixed schema.
+    Files that do not fit the schema (bad dates, text in Px) fall back to an
+    untyped pandas read and are coerced column-wise in _clean instead.
     """
-    if value is None:
-        return None
-    if isinstance(value, (float, int)):
-        return float(value)
-    if isinstance(value, str):
-        # Check if it looks like a date string (YYYY-MM-DD format)
-        if len(value) == 10 and value.count('-') == 2:
-            try:
-                year, month, day = value.split('-')
-                if len(year) == 4 and len(month) == 2 and len(day) == 2:
-                    # It's likely a date string, return None
-                    return None
-            except:
-                pass
+    opts = pacsv.ConvertOptions(column_types=CSV_COLUMN_TYPES)
     try:
-        # Try direct conversion
-        return float(value)
-    except (ValueError, TypeError):
+        return pacsv.read_csv(p, convert_options=opts).to_pandas()
+    except pa.ArrowInvalid as e:
+        print(f"Strict CSV parse failed for {p}, falling back to pandas: {e}")
+        return pd.read_csv(p)
+
+
+def _read_dataset(p: Path) -> pd.DataFrame:
+    """Read a session dataset directory written by append_upload."""
+    dataset = pads.dataset(p, format="parquet", partitioning=DATASET_PARTITIONING)
+    return dataset.to_table().to_pandas()
+
+
+def _date_format(dates: pd.Series) -> str | None:
+    """
+    Pick a to_datetime format from the first non-null value so the column is
+    parsed in one vectorized pass: the literal %Y-%m-%d for plain dates,
+    ISO8601 for other ISO timestamps, else None to let pandas infer it.
+    """
+    valid = dates.dropna()
+    first = valid.iloc[0] if len(valid) else None
+    if not isinstance(first, str):
         return None
+    if len(first) >= 10 and first[4] == "-" and first[7] == "-":
+        return "%Y-%m-%d" if len(first) == 10 else "ISO8601"
+    return None
+
+
+def _coerce(df: pd.DataFrame) -> pd.DataFrame:
+    """Normalize column names and enforce Date/Symbol/Px types, dropping bad rows."""
+    df = df.rename(columns={c: c.strip() for c in df.columns})
+    df["Symbol"] = df["Symbol"].astype(str)
+    df["Px"] = pd.to_numeric(df["Px"], errors="coerce").astype(np.float64)
+    if not pd.api.types.is_datetime64_any_dtype(df["Date"]):
+        df["Date"] = pd.to_datetime(df["Date"], format=_date_format(df["Date"]), errors="coerce")
+    return df.dropna(subset=["Symbol", "Px", "Date"])
+
+
+def _upload_token(upload_id: str) -> str:
+    """Fixed-width id for an upload's part files; no id is a prefix of another."""
+    return hashlib.sha1(upload_id.encode()).hexdigest()[:16]
+
+
+def _upload_parts(dataset_dir: Path, upload_id: str) -> list[Path]:
+    """Part files that append_upload wrote for `upload_id`."""
+    return list(dataset_dir.glob(f"*/upload-{_upload_token(upload_id)}-*.parquet"))
+
+
+def append_upload(src: str | Path, dataset_dir: str | Path, upload_id: str | None = None) -> Path:
+    """
+    Add one uploaded CSV/Parquet file to a session-level Parquet dataset
+    partitioned by Symbol, so many small uploads are read back as a single
+    dataset. upload_id identifies the upload (the UI passes Streamlit's
+    file_id; defaults to the file name). Parts a previous save under the same
+    id wrote are deleted first, so re-saving replaces its rows, including
+    symbols it no longer has.
+    """
+    src, dataset_dir = Path(src), Path(dataset_dir)
+    upload_id = upload_id or src.name
+    raw = pd.read_parquet(src) if src.suffix.lower() == ".parquet" else _read_csv(src)
+    df = _coerce(raw)[["Date", "Symbol", "Px"]]
+    # One timestamp unit across parts, whichever reader produced them
+    df["Date"] = df["Date"].astype("datetime64[ns]")
+    for part in _upload_parts(dataset_dir, upload_id):
+        part.unlink()
+    pads.write_dataset(
+        pa.Table.from_pandas(df, preserve_index=False),
+        dataset_dir,
+        format="parquet",
+        partitioning=DATASET_PARTITIONING,
+        basename_template=f"upload-{_upload_token(upload_id)}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+    return dataset_dir
+
+
+def prune_uploads(dataset_dir: str | Path, keep: list[str]) -> None:
+    """Delete dataset parts of every upload id not in `keep`, plus empty partitions."""
+    dataset_dir = Path(dataset_dir)
+    if not dataset_dir.exists():
+        return
+    kept = {part for upload_id in keep for part in _upload_parts(dataset_dir, upload_id)}
+    for part in dataset_dir.glob("*/upload-*.parquet"):
+        if part not in kept:
+            part.unlink()
+    for partition in dataset_dir.iterdir():
+        if partition.is_dir() and not any(partition.iterdir()):
+            partition.rmdir()
+
+
+def _clean(df: pd.DataFrame) -> pd.DataFrame:
+    """Normalize columns, coerce types and compute per-symbol returns."""
+    df = _coerce(df)
 
+    # Compute returns per symbol: one pass over the sorted prices, masking
+    # the first row of each symbol instead of a groupby().pct_change()
+    df = df.sort_values(["Symbol", "Date"], kind="mergesort")
+    # One price per (Symbol, Date): duplicates would add fake 0% returns and
+    # cross-join in factor_regression's Date merge. The stable sort keeps
+    # input order, so the last occurrence wins.
+    df = df.drop_duplicates(subset=["Symbol", "Date"], keep="last")
+    px = df["Px"].to_numpy(dtype=np.float64)
+    sym = df["Symbol"].to_numpy()
+    ret = np.empty_like(px)
+    ret[:1] = np.nan
+    with np.errstate(divide="ignore", invalid="ignore"):  # non-finite rows are dropped below
+        ret[1:] = px[1:] / px[:-1] - 1.0
+    ret[1:][sym[1:] != sym[:-1]] = np.nan
+    df["Ret"] = ret
+    # Drops each symbol's first row (NaN) and returns off a zero price (inf),
+    # so every consumer gets finite returns
+    df = df[np.isfinite(ret)]
+    return df[["Date", "Symbol", "Px", "Ret"]].reset_index(drop=True)
 
-def safe_float_conversion_wrapper(func):
-    """Decorator to catch and debug float conversion errors"""
-    def wrapper(*args, **kwargs):
-        try:
-            return func(*args, **kwargs)
-        except Exception as e:
-            if "could not convert string to float" in str(e):
-                print(f"ERROR in {func.__name__}: {str(e)}")
-                print(f"Args: {args}")
-                print(f"Kwargs: {kwargs}")
-                # Try to identify problematic data
-                for i, arg in enumerate(args):
-                    if hasattr(arg, 'dtypes'):  # It's a DataFrame
-                        print(f"DataFrame arg {i} dtypes:")
-                        print(arg.dtypes)
-                        print(f"DataFrame arg {i} sample data:")
-                        print(arg.head())
-            raise e
-    return wrapper
+
+@lru_cache(maxsize=8)
+def _load_clean(path: str, mtime_ns: int, size: int) -> pd.DataFrame:
+    """
+    Cached body of _read_and_clean, keyed by (path, mtime, size) so an
+    overwritten upload is re-read. CSVs are cleaned once and persisted to
+    CACHE_DIR as Parquet; later processes read that instead of re-parsing.
+    Writing a new entry removes the path's older ones.
+    """
+    p = Path(path)
+    if p.is_dir():
+        return _clean(_read_dataset(p))
+    if p.suffix.lower() == ".parquet":
+        return _clean(pd.read_parquet(p))
+
+    # <path digest>-<version/stat digest>: one live entry per source path
+    path_digest = hashlib.sha1(path.encode()).hexdigest()
+    digest = hashlib.sha1(f"{_CLEAN_VERSION}:{mtime_ns}:{size}".encode()).hexdigest()
+    cached = CACHE_DIR / f"{path_digest}-{digest}.parquet"
+    if cached.exists():
+        return pd.read_parquet(cached)
+
+    df = _clean(_read_csv(p))
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # Write-then-rename so concurrent workers never see a partial file
+        tmp = cached.with_suffix(f".{os.getpid()}.tmp")
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, cached)
+        # Entries for older versions of this file (or of _clean) are dead
+        for stale in CACHE_DIR.glob(f"{path_digest}-*.parquet"):
+            if stale != cached:
+                stale.unlink(missing_ok=True)
+    except OSError as e:
+        print(f"Could not write parquet cache {cached}: {e}")
+    return df
 
 
 def _read_and_clean(path: str | Path) -> pd.DataFrame:
     """
     Load data into pandas, parse Date, compute returns.
+    path may be a CSV/Parquet file or a session dataset directory.
     Returns DataFrame with columns: Date, Symbol, Px, Ret (all numeric as needed).
+    Results are memoized per (path, mtime, size); callers get their own copy.
     """
-    p = Path(path)
-    if p.suffix.lower() == ".parquet":
-        df = pd.read_parquet(p)
+    p = Path(path).resolve()
+    if p.is_dir():
+        # Session dataset: any appended or replaced part changes the key
+        stats = [f.stat() for f in p.rglob("*.parquet")]
+        mtime_ns = max((st.st_mtime_ns for st in stats), default=0)
+        size = sum(st.st_size for st in stats)
     else:
-        df = pd.read_csv(p, parse_dates=["Date"], infer_datetime_format=True)
+        stat = p.stat()
+        mtime_ns, size = stat.st_mtime_ns, stat.st_size
+    return _load_clean(str(p), mtime_ns, size).copy()
 
-    # Normalize and coerce types
-    df = df.rename(columns={c: c.strip() for c in df.columns})
-    df["Symbol"] = df["Symbol"].astype(str)
-    df["Px"] = pd.to_numeric(df["Px"], errors="coerce")
-    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
-    df = df.dropna(subset=["Symbol", "Px", "Date"])
 
-    # Compute returns per symbol
-    df = df.sort_values(["Symbol", "Date"])
-    df["Ret"] = df.groupby("Symbol")["Px"].pct_change()
-    df = df.dropna(subset=["Ret"])
-    return df[["Date", "Symbol", "Px", "Ret"]]
+@dataclass(frozen=True)
+class SoA:
+    """
+    Struct-of-arrays layout of the returns, grouped by symbol.
+    Rows are ordered by symbol code, so group i is the zero-copy slice
+    returns[starts[i]:starts[i + 1]].
+    """
+    symbols: np.ndarray   # unique symbols, indexed by code
+    codes: np.ndarray     # int32 symbol code per row
+    returns: np.ndarray   # float32 returns, non-finite values removed
+    starts: np.ndarray    # int64 group offsets, length len(symbols) + 1
+
+    def group(self, i: int) -> np.ndarray:
+        return self.returns[self.starts[i]:self.starts[i + 1]]
+
+
+def to_soa(df: pd.DataFrame) -> SoA:
+    """Convert a cleaned returns frame into the SoA buffers used by the risk code."""
+    codes, uniques = pd.factorize(df["Symbol"], sort=True, use_na_sentinel=False)
+    rets = df["Ret"].to_numpy(dtype=np.float64)
+    # _clean already guarantees finite returns; this guards frames built elsewhere
+    keep = np.isfinite(rets)
+    codes, rets = codes[keep], rets[keep]
+    if codes.size > 1 and np.any(codes[1:] < codes[:-1]):
+        order = np.argsort(codes, kind="stable")
+        codes, rets = codes[order], rets[order]
+    codes = codes.astype(np.int32)
+    starts = np.searchsorted(codes, np.arange(len(uniques) + 1)).astype(np.int64)
+    return SoA(np.asarray(uniques), codes, rets.astype(np.float32), starts)
+
+
+# Only reassociation/contraction so the sums may vectorize; to_soa already
+# drops non-finite returns, and IEEE inf/NaN semantics are kept regardless
+@njit(parallel=True, fastmath={"reassoc", "contract"}, cache=True)
+def var_es_all(returns: np.ndarray, starts: np.ndarray, z: float, level: float):
+    """
+    Gaussian VaR/ES for every SoA group in one compiled call, parallel over
+    symbols. Two-pass float64 mean/std per slice; agrees with _var_es up to
+    summation-order rounding, including 0 for empty groups and max(0, -mu)
+    when sigma is 0.
+    """
+    n = starts.size - 1
+    var = np.zeros(n)
+    es = np.zeros(n)
+    tail = np.exp(-z * z / 2) / (np.sqrt(2 * np.pi) * (1 - level))
+    for i in prange(n):
+        s, e = starts[i], starts[i + 1]
+        m = e - s
+        if m == 0:
+            continue
+        total = 0.0
+        for j in range(s, e):
+            total += returns[j]
+        mu = total / m
+        sigma = 0.0
+        if m > 1:
+            sq = 0.0
+            for j in range(s, e):
+                d = returns[j] - mu
+                sq += d * d
+            sigma = np.sqrt(sq / (m - 1))
+        var[i] = max(0.0, -(mu - z * sigma))
+        es[i] = max(0.0, -(mu - sigma * tail))
+    return var, es
 
 
 def _var_es(arr: np.ndarray, level: float = 0.99) -> tuple[float, float]:
     """
     Compute parametric VaR & ES under Gaussian assumption.
-    Input arr must be a 1D float array with no NaNs.
+    Input arr must be a 1D float array with no NaNs (float32 SoA slices are fine).
     """
     if arr.size == 0:
         return 0.0, 0.0
-    mu = float(arr.mean())
-    sigma = float(arr.std(ddof=1)) if arr.size > 1 else 0.0
+    mu = float(arr.mean(dtype=np.float64))
+    sigma = float(arr.std(ddof=1, dtype=np.float64)) if arr.size > 1 else 0.0
     if sigma == 0.0:
         loss = max(0.0, -mu)
         return loss, loss
-    z = abs(np.quantile(np.random.normal(size=100_000), 1 - level))
+    z = float(norm.ppf(level))
     var = mu - z * sigma
     es = mu - sigma * np.exp(-z**2 / 2) / (np.sqrt(2 * np.pi) * (1 - level))
     return float(max(0.0, -var)), float(max(0.0, -es))
@@ -108,67 +300,77 @@ def _var_es(arr: np.ndarray, level: float = 0.99) -> tuple[float, float]:
 def compute_risk(df: pd.DataFrame, level: float = 0.99) -> pd.DataFrame:
     """
     Compute VaR/ES per symbol.
-    Uses parse_to_float on every return value to filter out any non-numeric entries.
+    Same Gaussian model as _var_es, evaluated for all symbols in a single
+    call to the Numba kernel var_es_all over the float32 SoA buffer.
     """
-    records = []
-    for sym, grp in df.groupby("Symbol", dropna=False):
-        # Coerce Ret series to numeric, dropping bad values
-        rets = grp["Ret"].map(parse_to_float).dropna().astype(float).values
-        var, es = _var_es(np.array(rets, dtype=float), level)
-        records.append({"Symbol": sym, "VaR": var, "ES": es})
-    return pd.DataFrame(records)
+    soa = to_soa(df)
+    var, es = var_es_all(soa.returns, soa.starts, float(norm.ppf(level)), float(level))
+    return pd.DataFrame({"Symbol": soa.symbols, "VaR": var, "ES": es})
 
 
-@safe_float_conversion_wrapper
 def factor_regression(df: pd.DataFrame, market: str = "SPY") -> tuple[pd.DataFrame, pd.DataFrame]:
     """
     CAPM beta regression vs market.
-    Pivot to wide, coerce all cells to float via parse_to_float, then drop NaNs.
-    """
-    # Pivot the returns
-    wide = df.pivot(index="Date", columns="Symbol", values="Ret")
-    
-    # FIXED: Apply parse_to_float first, then convert to numeric using pd.to_numeric
-    # This properly handles None values returned by parse_to_float
-    for col in wide.columns:
-        wide[col] = wide[col].map(parse_to_float)
-    
-    # Convert to numeric, coercing any remaining problematic values to NaN
-    wide = wide.apply(pd.to_numeric, errors='coerce').dropna(how="any")
-
-    cols = wide.columns.tolist()
-    if market not in cols:
-        market = cols[0] if cols else market
-    if market not in cols or len(cols) < 2:
-        return pd.DataFrame(columns=["Symbol", "Beta"]), pd.DataFrame(columns=["Symbol", "ResidualVar"])
-
-    X = wide[[market]].values
-    Y = wide.drop(columns=[market]).values
-    assets = wide.drop(columns=[market]).columns.tolist()
+    Each asset is inner-joined to the market on Date and fitted on its own
+    overlapping history, so a gap in one symbol no longer drops that date for
+    every other symbol and no dense Date x Symbol matrix is built.
+    """
+    empty = pd.DataFrame(columns=["Symbol", "Beta"]), pd.DataFrame(columns=["Symbol", "ResidualVar"])
+    rets = df.loc[df["Ret"].notna(), ["Date", "Symbol", "Ret"]]
+
+    symbols = sorted(rets["Symbol"].unique().tolist())
+    if market not in symbols:
+        market = symbols[0] if symbols else market
+    if market not in symbols or len(symbols) < 2:
+        return empty
+
+    mkt = rets.loc[rets["Symbol"] == market, ["Date", "Ret"]].rename(columns={"Ret": "Mkt"})
+    pairs = rets[rets["Symbol"] != market].merge(mkt, on="Date", how="inner")
 
     # Add safety check for empty data
-    if X.size == 0 or Y.size == 0:
-        return pd.DataFrame(columns=["Symbol", "Beta"]), pd.DataFrame(columns=["Symbol", "ResidualVar"])
+    if pairs.empty:
+        return empty
 
-    lr = LinearRegression().fit(X, Y)
-    betas = pd.DataFrame({"Symbol": assets, "Beta": lr.coef_.flatten().tolist()})
+    # Closed-form univariate OLS per asset: beta = cov(x, y) / var(x),
+    # from centred sums over each asset's aligned rows
+    g = pairs.groupby("Symbol", sort=True)
+    x_c = pairs["Mkt"] - g["Mkt"].transform("mean")
+    y_c = pairs["Ret"] - g["Ret"].transform("mean")
+    sums = pd.DataFrame({
+        "Symbol": pairs["Symbol"], "sxx": x_c * x_c, "sxy": x_c * y_c, "syy": y_c * y_c,
+    }).groupby("Symbol", sort=True).sum()
+    n = g.size().to_numpy()
+    sxx, sxy, syy = (sums[c].to_numpy(dtype=np.float64) for c in ("sxx", "sxy", "syy"))
 
-    residuals = Y - lr.predict(X)
+    # A flat market series has no slope; match lstsq's minimum-norm answer
+    betas_arr = np.divide(sxy, sxx, out=np.zeros_like(sxy), where=sxx > 0.0)
+    assets = sums.index.tolist()
+    betas = pd.DataFrame({"Symbol": assets, "Beta": betas_arr.tolist()})
+
+    # OLS residuals have zero mean, so their ddof=1 variance is SSR / (n - 1)
+    ssr = np.maximum(syy - betas_arr * sxy, 0.0)
+    resid_var_arr = np.divide(ssr, n - 1, out=np.full_like(ssr, np.nan), where=n > 1)
     resid_var = pd.DataFrame({
         "Symbol": assets,
-        "ResidualVar": residuals.var(axis=0, ddof=1).tolist()
+        "ResidualVar": resid_var_arr.tolist()
     })
 
     return betas, resid_var
 
 
+# Columns of the run_factor_model summary table
+SUMMARY_COLUMNS = ["Symbol", "Beta", "VaR", "ES", "ResidualVar"]
+
+
 def run_factor_model(file_path: str, priors: dict | None = None) -> dict:
     """
     Run the full pipeline:
     1) Read & clean data
     2) Compute risk metrics
     3) Compute factor regression
-    4) Package results for Streamlit - ensuring all data is JSON serializable
+    4) Package results for Streamlit - ensuring all data is JSON serializable;
+       summary.data is column-oriented (column name -> list of values) on
+       both the success and the error path
     """
     try:
         df = _read_and_clean(file_path)
@@ -183,35 +385,25 @@ def run_factor_model(file_path: str, priors: dict | None = None) -> dict:
                  .reset_index(drop=True)
         )
 
-        # Convert all data to JSON-serializable format
-        # Ensure all numeric values are Python floats, not numpy types
-        summary_dict = summary.copy()
-        for col in summary_dict.select_dtypes(include=['number']).columns:
-            summary_dict[col] = summary_dict[col].astype(float).tolist()
-        
-        # Convert DataFrame to dict format that's JSON serializable
+        # One columnar pass: to_dict("list") already boxes numpy scalars to
+        # Python floats/strs, and the chart series reuse the same lists
+        columns = summary.to_dict("list")
         summary_json = {
-            "data": summary_dict.to_dict('records'),  # List of dicts
-            "schema": {"fields": [{"name": col, "type": "number" if summary[col].dtype.kind in 'biufc' else "string"} 
+            "data": columns,  # Column-oriented: column name -> list of values
+            "schema": {"fields": [{"name": col, "type": "number" if summary[col].dtype.kind in 'biufc' else "string"}
                                 for col in summary.columns]}
         }
 
         return {
             "summary": summary_json,
-            "var_chart": {
-                "x": [str(x) for x in summary["Symbol"].tolist()], 
-                "y": [float(x) for x in summary["VaR"].tolist()]
-            },
-            "beta_chart": {
-                "x": [str(x) for x in summary["Symbol"].tolist()], 
-                "y": [float(x) for x in summary["Beta"].tolist()]
-            },
+            "var_chart": {"x": columns["Symbol"], "y": columns["VaR"]},
+            "beta_chart": {"x": columns["Symbol"], "y": columns["Beta"]},
         }
     except Exception as e:
         # Add better error handling
         print(f"Error in run_factor_model: {str(e)}")
         return {
-            "summary": {"data": [], "schema": {"fields": []}},
+            "summary": {"data": {col: [] for col in SUMMARY_COLUMNS}, "schema": {"fields": []}},
             "var_chart": {"x": [], "y": []},
             "beta_chart": {"x": [], "y": []},
             "error": str(e)
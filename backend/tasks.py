@@ -4,6 +4,7 @@ backend/tasks.py
 Celery tasks for StratLab analytics.
 """
 
+import os
 import sys
 import pathlib
 from pathlib import Path
@@ -18,13 +19,17 @@ from backend.compute import run_factor_model
 import traceback
 
 # Create Celery app instance
+BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://dragonfly:6379/0')
+RESULT_URL = os.getenv('CELERY_RESULT_BACKEND', BROKER_URL)
+
 celery = Celery('stratlab')
 celery.conf.update(
-    broker_url='redis://redis:6379/0',
-    result_backend='redis://redis:6379/0',
-    task_serializer='json',
-    accept_content=['json'],
-    result_serializer='json',
+    broker_url=BROKER_URL,
+    result_backend=RESULT_URL,
+    # msgpack: compact binary floats instead of JSON text; JSON still accepted
+    task_serializer='msgpack',
+    accept_content=['msgpack', 'json'],
+    result_serializer='msgpack',
     timezone='UTC',
     enable_utc=True,
 )
@@ -71,58 +76,59 @@ def factor_analysis(self, file_path: str, priors: dict = None):
         error_traceback = traceback.format_exc()
         print(f"Task failed with error: {str(e)}")
         print(f"Full traceback: {error_traceback}")
-        
-        # Re-raise with a cleaner error message for specific issues
-        error_msg = str(e)
-        if "could not convert string to float" in error_msg:
-            if "2025-01-01" in error_msg or any(char in error_msg for char in ['-', '/']):
-                raise ValueError(
-                    "Data processing error: Found date strings in numeric columns. "
-                    "Please ensure your data has dates only in the 'Date' column and "
-                    "numeric values in 'Px' and 'Ret' columns."
-                )
-        
-        # Re-raise the original exception for other errors
+
         raise e
 
 
 # Optional: Add a simpler test task for debugging
 @celery.task
 def test_data_loading(file_path: str):
-    """Test task to check data loading and basic processing."""
+    """
+    Schema-only probe of an upload: reads Parquet footers / dataset metadata,
+    or a single CSV batch, instead of running the full _read_and_clean.
+    """
     try:
-        from backend.compute import _read_and_clean
-        
-        df = _read_and_clean(file_path)
-        
-        # Convert datetime and other non-JSON-serializable types
-        dtypes_dict = {}
-        for col, dtype in df.dtypes.items():
-            if 'datetime' in str(dtype):
-                dtypes_dict[col] = 'datetime64'
-            else:
-                dtypes_dict[col] = str(dtype)
-        
-        # Convert sample data to JSON-serializable format
-        sample_data = df.head().copy()
-        for col in sample_data.columns:
-            if 'datetime' in str(sample_data[col].dtype):
-                sample_data[col] = sample_data[col].dt.strftime('%Y-%m-%d')
-        
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+        import pyarrow.dataset as pads
+        import pyarrow.parquet as pq
+        from backend.compute import CSV_COLUMN_TYPES, DATASET_PARTITIONING
+
+        p = Path(file_path)
+        rows = None  # unknown for CSV without a full scan
+        if p.is_dir():
+            dataset = pads.dataset(p, format="parquet", partitioning=DATASET_PARTITIONING)
+            schema = dataset.schema
+            rows = dataset.count_rows()
+        elif p.suffix.lower() == ".parquet":
+            schema = pq.read_schema(p)
+            rows = pq.ParquetFile(p).metadata.num_rows
+        else:
+            try:
+                convert_opts = pacsv.ConvertOptions(column_types=CSV_COLUMN_TYPES)
+                schema = pacsv.open_csv(p, convert_options=convert_opts).read_next_batch().schema
+            except pa.ArrowInvalid:
+                # First block does not fit the strict schema; report what pyarrow infers
+                schema = pacsv.open_csv(p).read_next_batch().schema
+
+        # column_types silently ignores absent columns, so check them here
+        missing = [c for c in CSV_COLUMN_TYPES if c not in {n.strip() for n in schema.names}]
+        if missing:
+            return {
+                "success": False,
+                "error": f"Missing required column(s): {', '.join(missing)}; found {schema.names}",
+                "columns": schema.names,
+            }
+
         return {
             "success": True,
-            "shape": list(df.shape),  # Convert tuple to list
-            "columns": df.columns.tolist(),
-            "dtypes": dtypes_dict,
-            "sample_data": sample_data.to_dict(),
-            "date_range": {
-                "min": df["Date"].min().strftime('%Y-%m-%d'),
-                "max": df["Date"].max().strftime('%Y-%m-%d')
-            }
+            "rows": rows,
+            "columns": schema.names,
+            "dtypes": {field.name: str(field.type) for field in schema},
         }
     except Exception as e:
         return {
             "success": False,
             "error": str(e),
             "traceback": traceback.format_exc()
-        }
\ No newline at end of file
+        }
@@ -1,6 +1,18 @@
+import json
+from pathlib import Path
 
+import numpy as np
+import pandas as pd
 import polars as pl
-from backend.compute import compute_risk
+from scipy.stats import norm
+
+import backend.compute as compute
+from backend.compute import (
+    _date_format, _var_es, compute_risk, factor_regression, to_soa,
+)
+
+SAMPLE_CSV = Path(__file__).resolve().parent.parent / "sample-data" / "px_sp500.csv"
+
 
 def test_var():
     df = pl.DataFrame({
@@ -10,3 +22,227 @@ def test_var():
     }).with_columns(pl.col('Px').pct_change().over('Symbol').alias('Ret')).drop_nulls()
     out = compute_risk(df,0.95)
     assert out['VaR'][0]>0 and out['ES'][0]>0
+
+
+def test_var_es_deterministic():
+    arr = np.array([0.01, -0.02, 0.015, -0.03, 0.005])
+    var, es = _var_es(arr, 0.99)
+    assert _var_es(arr, 0.99) == (var, es)
+    assert np.isclose(var, -(arr.mean() - norm.ppf(0.99) * arr.std(ddof=1)))
+    assert es >= var
+
+
+def test_compute_risk_matches_var_es():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "Symbol": ["AAA"] * 20 + ["BBB"] * 20 + ["CCC"],
+        "Ret": np.concatenate([rng.normal(0, 0.01, 20), rng.normal(0.001, 0.02, 20), [0.01]]),
+    })
+    out = compute_risk(df, 0.99).set_index("Symbol")
+    for sym, grp in df.groupby("Symbol"):
+        var, es = _var_es(grp["Ret"].to_numpy(), 0.99)
+        assert np.isclose(out.loc[sym, "VaR"], var)
+        assert np.isclose(out.loc[sym, "ES"], es)
+
+
+def test_factor_regression_beta():
+    rng = np.random.default_rng(1)
+    dates = pd.date_range("2025-01-01", periods=50)
+    mkt = rng.normal(0, 0.01, 50)
+    asset = 1.5 * mkt + 0.0005
+    df = pd.DataFrame({
+        "Date": np.concatenate([dates, dates]),
+        "Symbol": ["SPY"] * 50 + ["AAA"] * 50,
+        "Ret": np.concatenate([mkt, asset]),
+    })
+    betas, resid = factor_regression(df)
+    assert np.isclose(betas.set_index("Symbol").loc["AAA", "Beta"], 1.5)
+    assert np.isclose(resid.set_index("Symbol").loc["AAA", "ResidualVar"], 0.0)
+
+
+def test_read_and_clean_caches_csv(tmp_path, monkeypatch):
+    monkeypatch.setattr(compute, "CACHE_DIR", tmp_path / "cache")
+    src = tmp_path / "px.csv"
+    src.write_text(
+        "Date,Symbol,Px\n"
+        "2025-01-01,AAA,100\n2025-01-02,AAA,101\n2025-01-03,AAA,bad\n2025-01-04,AAA,103\n"
+    )
+    first = compute._read_and_clean(src)
+    assert len(list((tmp_path / "cache").glob("*.parquet"))) == 1
+    compute._load_clean.cache_clear()
+    second = compute._read_and_clean(src)
+    assert first.equals(second)
+    assert first["Ret"].notna().all() and len(first) == 2
+
+
+def test_parquet_cache_replaces_stale_entries(tmp_path, monkeypatch):
+    cache = tmp_path / "cache"
+    monkeypatch.setattr(compute, "CACHE_DIR", cache)
+    src = tmp_path / "px.csv"
+    src.write_text("Date,Symbol,Px\n2025-01-01,AAA,100\n2025-01-02,AAA,101\n")
+    compute._read_and_clean(src)
+    first_entry = list(cache.glob("*.parquet"))
+
+    # Overwritten upload: the old entry is evicted
+    src.write_text("Date,Symbol,Px\n2025-01-01,AAA,100\n2025-01-02,AAA,110\n2025-01-03,AAA,121\n")
+    assert len(compute._read_and_clean(src)) == 2
+    entries = list(cache.glob("*.parquet"))
+    assert len(entries) == 1 and entries != first_entry
+
+    # New cleaning logic: entries written by the old version are not served
+    monkeypatch.setattr(compute, "_CLEAN_VERSION", compute._CLEAN_VERSION + 1)
+    compute._load_clean.cache_clear()
+    compute._read_and_clean(src)
+    assert len(list(cache.glob("*.parquet"))) == 1
+    assert list(cache.glob("*.parquet")) != entries
+
+
+def test_to_soa_groups():
+    df = pd.DataFrame({
+        "Symbol": ["BBB", "AAA", "BBB", "CCC", "AAA"],
+        "Ret": [0.02, 0.01, -0.01, np.nan, 0.03],
+    })
+    soa = to_soa(df)
+    assert soa.symbols.tolist() == ["AAA", "BBB", "CCC"]
+    assert soa.returns.dtype == np.float32
+    assert np.allclose(soa.group(0), [0.01, 0.03])
+    assert np.allclose(soa.group(1), [0.02, -0.01])
+    assert soa.group(2).size == 0
+    out = compute_risk(df)
+    assert out.loc[2, "VaR"] == 0.0 and out.loc[2, "ES"] == 0.0
+
+
+def test_read_and_clean_dtype_contract(tmp_path, monkeypatch):
+    monkeypatch.setattr(compute, "CACHE_DIR", tmp_path / "cache")
+    src = tmp_path / "px.parquet"
+    pd.DataFrame({
+        "Date": ["2025-01-01", "2025-01-02", "2025-01-03"],
+        "Symbol": ["AAA"] * 3,
+        "Px": [100, 101, 102],
+    }).to_parquet(src)
+    df = compute._read_and_clean(src)
+    assert list(df.columns) == ["Date", "Symbol", "Px", "Ret"]
+    assert pd.api.types.is_datetime64_any_dtype(df["Date"])
+    assert pd.api.types.is_string_dtype(df["Symbol"])
+    assert df["Px"].dtype == "float64" and df["Ret"].dtype == "float64"
+
+
+def test_factor_regression_misaligned_history():
+    rng = np.random.default_rng(2)
+    dates = pd.date_range("2025-01-01", periods=40)
+    mkt = rng.normal(0, 0.01, 40)
+    # BBB only starts halfway through; AAA must still use its full history
+    df = pd.DataFrame({
+        "Date": np.concatenate([dates, dates, dates[20:]]),
+        "Symbol": ["SPY"] * 40 + ["AAA"] * 40 + ["BBB"] * 20,
+        "Ret": np.concatenate([mkt, 0.8 * mkt, 2.0 * mkt[20:] + rng.normal(0, 1e-3, 20)]),
+    })
+    betas, resid = factor_regression(df)
+    betas = betas.set_index("Symbol")["Beta"]
+    assert np.isclose(betas["AAA"], 0.8)
+    assert abs(betas["BBB"] - 2.0) < 0.2
+    assert (resid["ResidualVar"] >= 0).all()
+
+
+def test_append_upload_dataset(tmp_path, monkeypatch):
+    monkeypatch.setattr(compute, "CACHE_DIR", tmp_path / "cache")
+    dataset = tmp_path / "session"
+    spy = [400.0, 404.0, 399.96, 407.9592]  # +1%, -1%, +2%
+    a = tmp_path / "a.csv"
+    a.write_text("Date,Symbol,Px\n" + "".join(
+        f"2025-01-0{i + 1},SPY,{px}\n2025-01-0{i + 1},AAA,{100 * px / 400}\n" for i, px in enumerate(spy)
+    ))
+    b = tmp_path / "b.csv"
+    b.write_text("Date,Symbol,Px\n" + "".join(
+        f"2025-01-0{i + 1},SPY,{px}\n" for i, px in enumerate(spy)
+    ) + "2025-01-01,BBB,50\n2025-01-02,BBB,51\n2025-01-03,BBB,49.98\n2025-01-04,BBB,51.9792\n")
+    compute.append_upload(a, dataset)
+    compute.append_upload(b, dataset)
+    compute.append_upload(a, dataset)  # re-saving the same upload must not duplicate rows
+
+    # Both uploads carry SPY; it must appear once per date
+    df = compute._read_and_clean(dataset)
+    assert sorted(df["Symbol"].unique()) == ["AAA", "BBB", "SPY"]
+    assert (df["Symbol"] == "SPY").sum() == 3
+    betas = factor_regression(df)[0].set_index("Symbol")["Beta"]
+    assert np.isclose(betas["AAA"], 1.0) and np.isclose(betas["BBB"], 2.0)
+
+    # Re-saving a.csv without AAA drops AAA; removing b.csv drops BBB
+    a.write_text("Date,Symbol,Px\n" + "".join(f"2025-01-0{i + 1},SPY,{px}\n" for i, px in enumerate(spy)))
+    compute.append_upload(a, dataset)
+    assert not (dataset / "Symbol=AAA").exists() or not any((dataset / "Symbol=AAA").iterdir())
+    compute.prune_uploads(dataset, ["a.csv"])
+    assert sorted(p.name for p in dataset.iterdir()) == ["Symbol=SPY"]
+    assert compute._read_and_clean(dataset)["Symbol"].unique().tolist() == ["SPY"]
+
+
+def test_run_factor_model_payload(tmp_path, monkeypatch):
+    monkeypatch.setattr(compute, "CACHE_DIR", tmp_path / "cache")
+    out = compute.run_factor_model(str(SAMPLE_CSV))
+    assert "error" not in out
+    data = out["summary"]["data"]
+    assert data["Symbol"] == out["var_chart"]["x"] == out["beta_chart"]["x"]
+    assert all(type(v) is float for v in data["VaR"] + data["Beta"])
+    json.dumps(out)
+
+
+def test_date_format_detection():
+    assert _date_format(pd.Series([None, "2025-01-02"])) == "%Y-%m-%d"
+    assert _date_format(pd.Series(["2025-01-02T09:30:00"])) == "ISO8601"
+    assert _date_format(pd.Series(["01/02/2025"])) is None
+
+
+def test_compute_risk_ignores_non_finite_returns():
+    df = pd.DataFrame({"Symbol": ["AAA"] * 4, "Ret": [-0.01, np.inf, 0.02, -0.03]})
+    out = compute_risk(df, 0.99)
+    var, es = _var_es(np.array([-0.01, 0.02, -0.03]), 0.99)
+    assert np.isclose(out.loc[0, "VaR"], var) and np.isclose(out.loc[0, "ES"], es)
+    assert var > 0
+
+    # A zero price gives an inf return in the masked diff; _clean must drop it
+    # so factor_regression sees only finite data too
+    dates = pd.date_range("2025-01-01", periods=6)
+    spy = [400.0, 404.0, 399.96, 407.9592, 403.879608, 411.95720016]
+    aaa = [100.0, 0.0, 99.0, 100.98, 99.9702, 101.969604]
+    cleaned = compute._clean(pd.DataFrame({
+        "Date": np.concatenate([dates, dates]),
+        "Symbol": ["SPY"] * 6 + ["AAA"] * 6,
+        "Px": spy + aaa,
+    }))
+    assert np.isfinite(cleaned["Ret"]).all()
+    with np.errstate(all="raise"):
+        betas, resid = factor_regression(cleaned)
+    assert np.isfinite(betas["Beta"]).all() and np.isfinite(resid["ResidualVar"]).all()
+
+
+def test_clean_drops_duplicate_symbol_dates():
+    raw = pd.DataFrame({
+        "Date": ["2025-01-01", "2025-01-02", "2025-01-02", "2025-01-03"],
+        "Symbol": ["AAA"] * 4,
+        "Px": [100.0, 999.0, 110.0, 121.0],
+    })
+    df = compute._clean(raw)
+    assert df["Date"].is_unique
+    assert np.allclose(df["Ret"], [0.10, 0.10])
+
+
+def test_run_factor_model_error_payload_shape(tmp_path):
+    out = compute.run_factor_model(str(tmp_path / "missing.csv"))
+    assert "error" in out
+    assert out["summary"]["data"] == {col: [] for col in compute.SUMMARY_COLUMNS}
+
+
+def test_append_upload_keys_parts_by_upload_id(tmp_path):
+    dataset = tmp_path / "session"
+    first = tmp_path / "one" / "prices.csv"
+    second = tmp_path / "two" / "prices.csv"
+    first.parent.mkdir()
+    second.parent.mkdir()
+    first.write_text("Date,Symbol,Px\n2025-01-01,AAA,100\n2025-01-02,AAA,101\n")
+    second.write_text("Date,Symbol,Px\n2025-01-01,BBB,100\n2025-01-02,BBB,101\n")
+    # Same file name, different uploads: neither may replace the other
+    compute.append_upload(first, dataset, upload_id="id-1")
+    compute.append_upload(second, dataset, upload_id="id-2")
+    assert sorted(p.name for p in dataset.iterdir()) == ["Symbol=AAA", "Symbol=BBB"]
+    compute.prune_uploads(dataset, ["id-2"])
+    assert sorted(p.name for p in dataset.iterdir()) == ["Symbol=BBB"]
@@ -0,0 +1,39 @@
+from pathlib import Path
+
+import pandas as pd
+from kombu.serialization import dumps, loads
+
+import backend.compute as compute
+from backend import tasks
+
+SAMPLE_CSV = Path(__file__).resolve().parent.parent / "sample-data" / "px_sp500.csv"
+
+
+def _msgpack_roundtrip(payload):
+    content_type, encoding, data = dumps(payload, serializer="msgpack")
+    return loads(data, content_type, encoding, accept=["application/x-msgpack"])
+
+
+def test_task_results_roundtrip_msgpack(tmp_path, monkeypatch):
+    monkeypatch.setattr(compute, "CACHE_DIR", tmp_path / "cache")
+    for result in (
+        tasks.factor_analysis.run(str(SAMPLE_CSV), {"lambda": 0.1}),
+        tasks.test_data_loading.run(str(SAMPLE_CSV)),
+        tasks.test_data_loading.run(str(tmp_path / "missing.csv")),
+    ):
+        assert _msgpack_roundtrip(result) == result
+
+
+def test_data_loading_probe_requires_columns(tmp_path):
+    good = tmp_path / "good.csv"
+    good.write_text("Date,Symbol,Px\n2025-01-01,AAA,100\n")
+    bad_csv = tmp_path / "bad.csv"
+    bad_csv.write_text("Date,Ticker,Close\n2025-01-01,AAA,100\n")
+    bad_parquet = tmp_path / "bad.parquet"
+    pd.DataFrame({"Date": ["2025-01-01"], "Ticker": ["AAA"], "Close": [100.0]}).to_parquet(bad_parquet)
+
+    assert tasks.test_data_loading.run(str(good))["success"] is True
+    for path in (bad_csv, bad_parquet):
+        result = tasks.test_data_loading.run(str(path))
+        assert result["success"] is False
+        assert "Symbol" in result["error"] and "Px" in result["error"]
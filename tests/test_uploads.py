@@ -0,0 +1,21 @@
+from app.uploads import removed_uploads
+
+
+def test_empty_uploader_after_page_switch_keeps_dataset():
+    saved = {"id-a": "a.csv", "id-b": "b.csv"}
+    # First rerun after returning to Upload: the widget comes back empty
+    assert removed_uploads(None, [], saved) == []
+    # Later reruns of the same visit still show nothing new removed
+    assert removed_uploads([], [], saved) == []
+
+
+def test_removal_within_a_visit_is_pruned():
+    saved = {"id-a": "a.csv", "id-b": "b.csv"}
+    assert removed_uploads(["id-a", "id-b"], ["id-a"], saved) == ["id-b"]
+    assert removed_uploads(["id-a", "id-b"], [], saved) == ["id-a", "id-b"]
+
+
+def test_uploads_from_earlier_visits_are_not_pruned():
+    # id-a was ingested on an earlier visit; this visit only showed id-c
+    saved = {"id-a": "a.csv", "id-c": "c.csv"}
+    assert removed_uploads(["id-c"], [], saved) == ["id-c"]